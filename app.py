@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, time, timedelta
 from functools import wraps
 from typing import Callable, Optional
 
@@ -20,13 +20,17 @@ from flask_login import (
     login_user,
     logout_user,
 )
-from werkzeug.security import check_password_hash, generate_password_hash
-from sqlalchemy import or_
+from argon2.exceptions import InvalidHashError, VerificationError
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.exceptions import BadRequest
+from werkzeug.security import check_password_hash
+from sqlalchemy import func, literal, or_, select, union_all, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
 
 from database import (
     Appointment,
     AppointmentStatus,
-    Department,
     Doctor,
     DoctorAvailability,
     Patient,
@@ -34,7 +38,10 @@ from database import (
     User,
     UserRole,
     db,
+    get_departments,
     init_db,
+    password_hasher,
+    user_search_filter,
 )
 
 
@@ -42,26 +49,102 @@ app = Flask(__name__)
 app.config["SECRET_KEY"] = "super-secret-hms-key"
 app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///hospital.db"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_pre_ping": True,
+    "connect_args": {"check_same_thread": False},
+}
+
+if not app.debug:
+    # TEMPLATES_AUTO_RELOAD is left unset so ``app.run(debug=True)`` still
+    # turns reloading back on for local development.
+    app.jinja_env.auto_reload = False
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
 
 db.init_app(app)
 login_manager = LoginManager(app)
 login_manager.login_view = "login"
 
+ADMIN_PAGE_SIZE = 50
+STATUS_NAMES = frozenset(AppointmentStatus.__members__)
+DASHBOARD_ENDPOINTS = {
+    UserRole.ADMIN.value: "admin_dashboard",
+    UserRole.DOCTOR.value: "doctor_dashboard",
+    UserRole.PATIENT.value: "patient_dashboard",
+}
+PRELOADED_TEMPLATES = (
+    "index.html",
+    "login.html",
+    "admin_dashboard.html",
+    "doctor_dashboard.html",
+    "patient_dashboard.html",
+    "book_appointment.html",
+    "doctor_search.html",
+)
+
 with app.app_context():
     init_db(app)
+    for template_name in PRELOADED_TEMPLATES:
+        app.jinja_env.get_template(template_name)
 
 @login_manager.user_loader
 def load_user(user_id: str) -> Optional[User]:
-    return User.query.get(int(user_id))
+    # Views read doctor_profile/patient_profile on almost every request, so
+    # fetch them with the user instead of lazily afterwards.
+    return db.session.get(
+        User,
+        int(user_id),
+        options=[joinedload(User.doctor_profile), joinedload(User.patient_profile)],
+    )
+
+
+def verify_password(user: User, password: str) -> bool:
+    """Check a password, upgrading legacy Werkzeug or stale Argon2 hashes."""
+    if not user.password_hash.startswith("$argon2"):
+        if not check_password_hash(user.password_hash, password):
+            return False
+        user.password_hash = password_hasher.hash(password)
+        db.session.commit()
+        return True
+    try:
+        password_hasher.verify(user.password_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+    if password_hasher.check_needs_rehash(user.password_hash):
+        user.password_hash = password_hasher.hash(password)
+        db.session.commit()
+    return True
+
+
+def parse_form_date(value: str) -> date:
+    """Parse a ``YYYY-MM-DD`` form value, rejecting anything else with 400."""
+    try:
+        if len(value) != 10 or not value[4] == value[7] == "-":
+            raise ValueError(value)
+        return date.fromisoformat(value)
+    except ValueError:
+        raise BadRequest(f"Invalid date: {value!r}") from None
+
+
+def parse_form_time(value: str) -> time:
+    """Parse an ``HH:MM`` form value, rejecting anything else with 400."""
+    try:
+        if len(value) != 5 or value[2] != ":" or not value.replace(":", "").isdigit():
+            raise ValueError(value)
+        return time(int(value[:2]), int(value[3:5]))
+    except ValueError:
+        raise BadRequest(f"Invalid time: {value!r}") from None
 
 
 def role_required(*roles: UserRole) -> Callable:
+    allowed_roles = frozenset(getattr(role, "value", role) for role in roles)
+
     def decorator(view: Callable) -> Callable:
         @wraps(view)
         def wrapped(*args, **kwargs):
             if not current_user.is_authenticated:
                 return login_manager.unauthorized()
-            allowed_roles = {getattr(role, "value", role) for role in roles}
             if current_user.role not in allowed_roles:
                 abort(403)
             return view(*args, **kwargs)
@@ -82,7 +165,7 @@ def inject_globals():
 
 @app.route("/")
 def index():
-    departments = Department.query.order_by(Department.name).all()
+    departments = get_departments()
     doctors = (
         Doctor.query.filter_by(is_active=True)
         .join(User)
@@ -102,7 +185,7 @@ def login():
         email = request.form.get("email", "").strip().lower()
         password = request.form.get("password", "")
         user = User.query.filter_by(email=email).first()
-        if user and user.is_active and check_password_hash(user.password_hash, password):
+        if user and user.is_active and verify_password(user, password):
             login_user(user)
             flash("Welcome back!", "success")
             return redirect(url_for("redirect_dashboard"))
@@ -127,7 +210,7 @@ def register():
             email=email,
             phone=phone,
             role=UserRole.PATIENT,
-            password_hash=generate_password_hash(password),
+            password_hash=password_hasher.hash(password),
         )
         patient = Patient(user=user)
         db.session.add_all([user, patient])
@@ -148,11 +231,7 @@ def logout():
 @app.route("/dashboard")
 @login_required
 def redirect_dashboard():
-    if current_user.role == UserRole.ADMIN:
-        return redirect(url_for("admin_dashboard"))
-    if current_user.role == UserRole.DOCTOR:
-        return redirect(url_for("doctor_dashboard"))
-    return redirect(url_for("patient_dashboard"))
+    return redirect(url_for(DASHBOARD_ENDPOINTS.get(current_user.role, "index")))
 
 
 @app.route("/admin/dashboard")
@@ -162,42 +241,70 @@ def admin_dashboard():
     search_doctor = request.args.get("doctor_query", "").strip()
     search_patient = request.args.get("patient_query", "").strip()
 
-    doctor_query = Doctor.query.join(User)
+    doctor_query = Doctor.query.join(User).options(
+        contains_eager(Doctor.user), joinedload(Doctor.department)
+    )
     if search_doctor:
-        like = f"%{search_doctor}%"
         doctor_query = doctor_query.filter(
-            or_(User.full_name.ilike(like), Doctor.specialization.ilike(like))
+            user_search_filter(search_doctor, "full_name", "specialization")
         )
-    doctors = doctor_query.all()
+    doctors = doctor_query.order_by(User.full_name.asc()).paginate(
+        page=request.args.get("doctor_page", 1, type=int),
+        per_page=ADMIN_PAGE_SIZE,
+        error_out=False,
+    )
 
-    patient_query = Patient.query.join(User)
+    patient_query = Patient.query.join(User).options(contains_eager(Patient.user))
     if search_patient:
-        like = f"%{search_patient}%"
-        filters = [User.full_name.ilike(like), User.phone.ilike(like)]
+        filters = [user_search_filter(search_patient, "full_name", "phone")]
         if search_patient.isdigit():
             filters.append(Patient.id == int(search_patient))
         patient_query = patient_query.filter(or_(*filters))
-    patients = patient_query.all()
+    patients = patient_query.order_by(User.full_name.asc()).paginate(
+        page=request.args.get("patient_page", 1, type=int),
+        per_page=ADMIN_PAGE_SIZE,
+        error_out=False,
+    )
 
-    total_doctors = Doctor.query.count()
-    total_patients = Patient.query.count()
-    total_appointments = Appointment.query.count()
+    appointments = (
+        Appointment.query.options(
+            joinedload(Appointment.patient).joinedload(Patient.user),
+            joinedload(Appointment.doctor).joinedload(Doctor.user),
+            joinedload(Appointment.department),
+        )
+        .order_by(
+            Appointment.appointment_date.desc(), Appointment.appointment_time.desc()
+        )
+        .paginate(
+            page=request.args.get("page", 1, type=int),
+            per_page=ADMIN_PAGE_SIZE,
+            error_out=False,
+        )
+    )
 
-    appointments = Appointment.query.order_by(
-        Appointment.appointment_date.desc(), Appointment.appointment_time.desc()
-    ).all()
+    # Each paginate() call already counted its rows; the appointment list is
+    # never filtered, and the others only need a separate count while a
+    # search narrows them.
+    counts = {"d": doctors.total, "p": patients.total, "a": appointments.total}
+    unfiltered = []
+    if search_doctor:
+        unfiltered.append(select(literal("d"), func.count()).select_from(Doctor))
+    if search_patient:
+        unfiltered.append(select(literal("p"), func.count()).select_from(Patient))
+    if unfiltered:
+        counts.update(db.session.execute(union_all(*unfiltered)).all())
 
     return render_template(
         "admin_dashboard.html",
-        total_doctors=total_doctors,
-        total_patients=total_patients,
-        total_appointments=total_appointments,
+        total_doctors=counts["d"],
+        total_patients=counts["p"],
+        total_appointments=counts["a"],
         doctors=doctors,
         patients=patients,
         appointments=appointments,
         doctor_query=search_doctor,
         patient_query=search_patient,
-        departments=Department.query.all(),
+        departments=get_departments(),
     )
 
 
@@ -223,7 +330,7 @@ def create_doctor():
         email=email,
         phone=phone,
         role=UserRole.DOCTOR,
-        password_hash=generate_password_hash(password),
+        password_hash=password_hasher.hash(password),
     )
     doctor_profile = Doctor(
         user=doctor_user,
@@ -301,7 +408,7 @@ def toggle_patient(patient_id: int):
 def admin_update_appointment(appointment_id: int):
     appointment = Appointment.query.get_or_404(appointment_id)
     status = request.form.get("status")
-    if status in AppointmentStatus.__members__:
+    if status in STATUS_NAMES:
         appointment.status = AppointmentStatus[status]
     db.session.commit()
     flash("Appointment status updated.", "success")
@@ -316,7 +423,11 @@ def doctor_dashboard():
     today = date.today()
     end_date = today + timedelta(days=7)
     upcoming = (
-        Appointment.query.filter(
+        Appointment.query.options(
+            joinedload(Appointment.patient).joinedload(Patient.user),
+            joinedload(Appointment.treatment_note),
+        )
+        .filter(
             Appointment.doctor_id == doctor.id,
             Appointment.appointment_date >= today,
             Appointment.appointment_date <= end_date,
@@ -324,10 +435,12 @@ def doctor_dashboard():
         .order_by(Appointment.appointment_date.asc())
         .all()
     )
+    patient_ids = select(Appointment.patient_id).where(
+        Appointment.doctor_id == doctor.id
+    )
     patients = (
-        Patient.query.join(Appointment)
-        .filter(Appointment.doctor_id == doctor.id)
-        .distinct()
+        Patient.query.filter(Patient.id.in_(patient_ids))
+        .options(selectinload(Patient.user))
         .all()
     )
     return render_template(
@@ -350,7 +463,7 @@ def update_appointment_status(appointment_id: int):
     prescription = request.form.get("prescription", "")
     notes = request.form.get("notes", "")
 
-    if status in AppointmentStatus.__members__:
+    if status in STATUS_NAMES:
         appointment.status = AppointmentStatus[status]
 
     if appointment.treatment_note:
@@ -376,9 +489,9 @@ def update_appointment_status(appointment_id: int):
 @role_required(UserRole.DOCTOR)
 def update_availability():
     doctor = current_user.doctor_profile
-    available_date = datetime.strptime(request.form["date"], "%Y-%m-%d").date()
-    start_time = datetime.strptime(request.form["start_time"], "%H:%M").time()
-    end_time = datetime.strptime(request.form["end_time"], "%H:%M").time()
+    available_date = parse_form_date(request.form["date"])
+    start_time = parse_form_time(request.form["start_time"])
+    end_time = parse_form_time(request.form["end_time"])
 
     today = date.today()
     if not (today <= available_date <= today + timedelta(days=7)):
@@ -411,17 +524,14 @@ def update_availability():
 def doctor_patient_history(patient_id: int):
     doctor = current_user.doctor_profile
     patient = Patient.query.get_or_404(patient_id)
-    has_relationship = (
-        Appointment.query.filter_by(patient_id=patient.id, doctor_id=doctor.id).count()
-        > 0
-    )
-    if not has_relationship:
-        abort(403)
     history = (
-        Appointment.query.filter_by(patient_id=patient.id, doctor_id=doctor.id)
+        Appointment.query.options(joinedload(Appointment.treatment_note))
+        .filter_by(patient_id=patient.id, doctor_id=doctor.id)
         .order_by(Appointment.appointment_date.desc())
         .all()
     )
+    if not history:
+        abort(403)
     return render_template(
         "doctor_patient_history.html", patient=patient, doctor=doctor, history=history
     )
@@ -433,7 +543,10 @@ def doctor_patient_history(patient_id: int):
 def patient_dashboard():
     patient = current_user.patient_profile
     upcoming = (
-        Appointment.query.filter(
+        Appointment.query.options(
+            joinedload(Appointment.doctor).joinedload(Doctor.user)
+        )
+        .filter(
             Appointment.patient_id == patient.id,
             Appointment.appointment_date >= date.today(),
         )
@@ -441,17 +554,24 @@ def patient_dashboard():
         .all()
     )
     history = (
-        Appointment.query.filter(
+        Appointment.query.options(
+            joinedload(Appointment.doctor).joinedload(Doctor.user),
+            joinedload(Appointment.treatment_note),
+        )
+        .filter(
             Appointment.patient_id == patient.id,
             Appointment.appointment_date < date.today(),
         )
         .order_by(Appointment.appointment_date.desc())
         .all()
     )
-    departments = Department.query.order_by(Department.name).all()
+    departments = get_departments()
     doctor_availability = (
         DoctorAvailability.query.join(Doctor)
         .join(User)
+        .options(
+            contains_eager(DoctorAvailability.doctor).contains_eager(Doctor.user)
+        )
         .filter(
             Doctor.is_active.is_(True),
             DoctorAvailability.available_date.between(
@@ -497,36 +617,34 @@ def patient_profile():
 def book_appointment():
     patient = current_user.patient_profile
     doctors = Doctor.query.filter_by(is_active=True).all()
-    departments = Department.query.all()
+    departments = get_departments()
     if request.method == "POST":
         doctor_id = int(request.form["doctor_id"])
         department_id = int(request.form["department_id"])
-        appointment_date = datetime.strptime(
-            request.form["appointment_date"], "%Y-%m-%d"
-        ).date()
-        appointment_time = datetime.strptime(
-            request.form["appointment_time"], "%H:%M"
-        ).time()
+        appointment_date = parse_form_date(request.form["appointment_date"])
+        appointment_time = parse_form_time(request.form["appointment_time"])
         reason = request.form.get("reason", "")
 
-        existing = Appointment.query.filter_by(
-            doctor_id=doctor_id,
-            appointment_date=appointment_date,
-            appointment_time=appointment_time,
-        ).first()
-        if existing:
+        appointments = Appointment.__table__
+        stmt = (
+            insert(appointments)
+            .values(
+                patient_id=patient.id,
+                doctor_id=doctor_id,
+                department_id=department_id,
+                appointment_date=appointment_date,
+                appointment_time=appointment_time,
+                reason=reason,
+            )
+            .on_conflict_do_nothing(
+                index_elements=["doctor_id", "appointment_date", "appointment_time"]
+            )
+            .returning(appointments.c.id)
+        )
+        if db.session.execute(stmt).first() is None:
+            db.session.rollback()
             flash("Slot already booked. Pick another time.", "danger")
             return redirect(url_for("book_appointment"))
-
-        appt = Appointment(
-            patient_id=patient.id,
-            doctor_id=doctor_id,
-            department_id=department_id,
-            appointment_date=appointment_date,
-            appointment_time=appointment_time,
-            reason=reason,
-        )
-        db.session.add(appt)
         db.session.commit()
         flash("Appointment booked successfully.", "success")
         return redirect(url_for("patient_dashboard"))
@@ -556,21 +674,24 @@ def reschedule_appointment(appointment_id: int):
     appointment = Appointment.query.get_or_404(appointment_id)
     if appointment.patient_id != current_user.patient_profile.id:
         abort(403)
-    new_date = datetime.strptime(request.form["appointment_date"], "%Y-%m-%d").date()
-    new_time = datetime.strptime(request.form["appointment_time"], "%H:%M").time()
-
-    conflict = Appointment.query.filter_by(
-        doctor_id=appointment.doctor_id,
-        appointment_date=new_date,
-        appointment_time=new_time,
-    ).first()
-    if conflict and conflict.id != appointment.id:
+    new_date = parse_form_date(request.form["appointment_date"])
+    new_time = parse_form_time(request.form["appointment_time"])
+
+    stmt = (
+        update(Appointment)
+        .where(Appointment.id == appointment.id)
+        .values(
+            appointment_date=new_date,
+            appointment_time=new_time,
+            status=AppointmentStatus.BOOKED,
+        )
+        .prefix_with("OR IGNORE")
+        .returning(Appointment.id)
+    )
+    if db.session.execute(stmt).first() is None:
+        db.session.rollback()
         flash("Selected slot is unavailable.", "danger")
         return redirect(url_for("patient_dashboard"))
-
-    appointment.appointment_date = new_date
-    appointment.appointment_time = new_time
-    appointment.status = AppointmentStatus.BOOKED
     db.session.commit()
     flash("Appointment rescheduled.", "success")
     return redirect(url_for("patient_dashboard"))
@@ -581,17 +702,12 @@ def search_doctors():
     specialization = request.args.get("specialization", "")
     name = request.args.get("name", "")
 
-    doctors = (
-        Doctor.query.join(User)
-        .filter(
-            Doctor.is_active.is_(True),
-            Doctor.specialization.ilike(f"%{specialization}%")
-            if specialization
-            else True,
-            User.full_name.ilike(f"%{name}%") if name else True,
-        )
-        .all()
-    )
+    filters = [Doctor.is_active.is_(True)]
+    if specialization:
+        filters.append(user_search_filter(specialization, "specialization"))
+    if name:
+        filters.append(user_search_filter(name, "full_name"))
+    doctors = Doctor.query.join(User).filter(*filters).all()
     return render_template("doctor_search.html", doctors=doctors)
 
 
@@ -1,13 +1,40 @@
 import enum
+import sqlite3
+import threading
 from datetime import datetime, date
-from typing import List
+from typing import Dict, List
 
+from argon2 import PasswordHasher
+from cachetools import TTLCache
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash
+from sqlalchemy import column, event, func, inspect, or_, select, table, text
+from sqlalchemy.engine import Engine, Row
 
 
 db = SQLAlchemy()
+password_hasher = PasswordHasher(
+    time_cost=3, memory_cost=65536, parallelism=2, hash_len=32, salt_len=16
+)
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-64000",
+)
+
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, _connection_record) -> None:
+    """Enable WAL and relaxed syncing on every new SQLite connection."""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
 
 
 class TimestampMixin:
@@ -34,14 +61,14 @@ class User(UserMixin, TimestampMixin, db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     full_name = db.Column(db.String(120), nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     phone = db.Column(db.String(40))
     role = db.Column(db.String(20), nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
     is_active = db.Column(db.Boolean, default=True)
 
-    doctor_profile = db.relationship("Doctor", backref="user", uselist=False)
-    patient_profile = db.relationship("Patient", backref="user", uselist=False)
+    doctor_profile = db.relationship("Doctor", back_populates="user", uselist=False)
+    patient_profile = db.relationship("Patient", back_populates="user", uselist=False)
 
     def __repr__(self) -> str:
         return f"<User {self.email} ({self.role})>"
@@ -54,7 +81,7 @@ class Department(TimestampMixin, db.Model):
     name = db.Column(db.String(120), nullable=False, unique=True)
     description = db.Column(db.Text)
 
-    doctors = db.relationship("Doctor", backref="department", lazy=True)
+    doctors = db.relationship("Doctor", back_populates="department", lazy=True)
 
     def __repr__(self) -> str:
         return f"<Department {self.name}>"
@@ -65,20 +92,24 @@ class Doctor(TimestampMixin, db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, unique=True)
-    department_id = db.Column(db.Integer, db.ForeignKey("departments.id"), nullable=False)
+    department_id = db.Column(
+        db.Integer, db.ForeignKey("departments.id"), nullable=False, index=True
+    )
     specialization = db.Column(db.String(120), nullable=False)
     room = db.Column(db.String(50))
     availability_summary = db.Column(db.String(255))
     bio = db.Column(db.Text)
-    is_active = db.Column(db.Boolean, default=True)
+    is_active = db.Column(db.Boolean, default=True, index=True)
 
+    user = db.relationship("User", back_populates="doctor_profile")
+    department = db.relationship("Department", back_populates="doctors")
     availabilities = db.relationship(
         "DoctorAvailability",
-        backref="doctor",
+        back_populates="doctor",
         lazy=True,
         cascade="all, delete-orphan",
     )
-    appointments = db.relationship("Appointment", backref="doctor", lazy=True)
+    appointments = db.relationship("Appointment", back_populates="doctor", lazy=True)
 
     def __repr__(self) -> str:
         return f"<Doctor {self.user.full_name} - {self.specialization}>"
@@ -96,7 +127,8 @@ class Patient(TimestampMixin, db.Model):
     emergency_contact = db.Column(db.String(120))
     insurance_provider = db.Column(db.String(120))
 
-    appointments = db.relationship("Appointment", backref="patient", lazy=True)
+    user = db.relationship("User", back_populates="patient_profile")
+    appointments = db.relationship("Appointment", back_populates="patient", lazy=True)
 
     def __repr__(self) -> str:
         return f"<Patient {self.user.full_name}>"
@@ -111,10 +143,13 @@ class DoctorAvailability(TimestampMixin, db.Model):
     start_time = db.Column(db.Time, nullable=False)
     end_time = db.Column(db.Time, nullable=False)
 
+    doctor = db.relationship("Doctor", back_populates="availabilities")
+
     __table_args__ = (
         db.UniqueConstraint(
             "doctor_id", "available_date", name="uniq_doctor_date_availability"
         ),
+        db.Index("ix_avail_date", "available_date"),
     )
 
     def __repr__(self) -> str:
@@ -135,9 +170,14 @@ class Appointment(TimestampMixin, db.Model):
     )
     reason = db.Column(db.String(255))
 
+    patient = db.relationship("Patient", back_populates="appointments")
+    doctor = db.relationship("Doctor", back_populates="appointments")
     department = db.relationship("Department")
     treatment_note = db.relationship(
-        "TreatmentNote", backref="appointment", uselist=False, cascade="all, delete-orphan"
+        "TreatmentNote",
+        back_populates="appointment",
+        uselist=False,
+        cascade="all, delete-orphan",
     )
 
     __table_args__ = (
@@ -147,6 +187,7 @@ class Appointment(TimestampMixin, db.Model):
             "appointment_time",
             name="uniq_doctor_slot",
         ),
+        db.Index("ix_appt_patient_date", "patient_id", "appointment_date"),
     )
 
     def __repr__(self) -> str:
@@ -164,39 +205,220 @@ class TreatmentNote(TimestampMixin, db.Model):
     prescription = db.Column(db.Text)
     notes = db.Column(db.Text)
 
+    appointment = db.relationship("Appointment", back_populates="treatment_note")
+
     def __repr__(self) -> str:
         return f"<TreatmentNote appointment={self.appointment_id}>"
 
 
-def create_default_departments() -> List[Department]:
+def create_default_departments() -> List[Dict[str, str]]:
     return [
-        Department(
-            name="Cardiology", description="Heart and vascular care including diagnostics."
-        ),
-        Department(name="Orthopedics", description="Bone, joint and muscle treatments."),
-        Department(name="Pediatrics", description="Child and adolescent wellness."),
-        Department(name="Dermatology", description="Skin conditions and cosmetic care."),
-        Department(name="General Medicine", description="Primary and preventive care."),
+        {
+            "name": "Cardiology",
+            "description": "Heart and vascular care including diagnostics.",
+        },
+        {"name": "Orthopedics", "description": "Bone, joint and muscle treatments."},
+        {"name": "Pediatrics", "description": "Child and adolescent wellness."},
+        {"name": "Dermatology", "description": "Skin conditions and cosmetic care."},
+        {"name": "General Medicine", "description": "Primary and preventive care."},
     ]
 
 
-def init_db(app) -> None:
-    """Create tables and seed default records if they don't exist."""
-    with app.app_context():
-        db.create_all()
-
-        if Department.query.count() == 0:
-            db.session.add_all(create_default_departments())
-            db.session.commit()
-
-        if not User.query.filter_by(role=UserRole.ADMIN).first():
-            admin_user = User(
-                full_name="Hospital Admin",
-                email="admin@hms.local",
-                phone="0000000000",
-                role=UserRole.ADMIN,
-                password_hash=generate_password_hash("Admin@123"),
-            )
-            db.session.add(admin_user)
-            db.session.commit()
+_department_cache: TTLCache = TTLCache(maxsize=1, ttl=300)
+_department_cache_lock = threading.Lock()
+
+
+def get_departments() -> List[Row]:
+    """Return ``(id, name, description)`` rows for all departments, by name.
+
+    Plain rows rather than ORM instances are cached, so they can be shared
+    across threads and never get tied to, or detached from, a session.
+    """
+    with _department_cache_lock:
+        departments = _department_cache.get("all")
+        if departments is None:
+            departments = db.session.execute(
+                select(
+                    Department.id, Department.name, Department.description
+                ).order_by(Department.name)
+            ).all()
+            _department_cache["all"] = departments
+        return departments
+
+
+@event.listens_for(Department, "after_insert")
+@event.listens_for(Department, "after_update")
+@event.listens_for(Department, "after_delete")
+def invalidate_department_cache(_mapper, _connection, _target) -> None:
+    with _department_cache_lock:
+        _department_cache.clear()
+
+
+user_search = table("user_search", column("rowid"))
+
+# Trigram tokens let MATCH find arbitrary substrings (partial phone numbers,
+# fragments of names), but only for terms of at least three characters.
+_TRIGRAM_MIN_LENGTH = 3
+
+
+def create_search_index() -> None:
+    """Create the FTS5 table behind doctor/patient search and backfill it."""
+    existing_sql = db.session.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'user_search'")
+    ).scalar()
+    if existing_sql and "trigram" in existing_sql:
+        return
+    if existing_sql:
+        db.session.execute(text("DROP TABLE user_search"))
+    db.session.execute(
+        text(
+            "CREATE VIRTUAL TABLE user_search USING fts5("
+            "full_name, phone, specialization, tokenize='trigram')"
+        )
+    )
+    db.session.execute(
+        text(
+            "INSERT INTO user_search (rowid, full_name, phone, specialization) "
+            "SELECT users.id, users.full_name, COALESCE(users.phone, ''), "
+            "COALESCE(doctors.specialization, '') "
+            "FROM users LEFT JOIN doctors ON doctors.user_id = users.id"
+        )
+    )
+    db.session.commit()
+
+
+def _reindex_user(connection, user_id: int) -> None:
+    connection.execute(
+        text("DELETE FROM user_search WHERE rowid = :user_id"), {"user_id": user_id}
+    )
+    connection.execute(
+        text(
+            "INSERT INTO user_search (rowid, full_name, phone, specialization) "
+            "SELECT users.id, users.full_name, COALESCE(users.phone, ''), "
+            "COALESCE(doctors.specialization, '') "
+            "FROM users LEFT JOIN doctors ON doctors.user_id = users.id "
+            "WHERE users.id = :user_id"
+        ),
+        {"user_id": user_id},
+    )
+
+
+def _search_columns_changed(target, *names: str) -> bool:
+    attrs = inspect(target).attrs
+    return any(getattr(attrs, name).history.has_changes() for name in names)
+
+
+@event.listens_for(User, "after_insert")
+def index_new_user(_mapper, connection, target) -> None:
+    _reindex_user(connection, target.id)
 
+
+@event.listens_for(User, "after_update")
+def index_user(_mapper, connection, target) -> None:
+    if _search_columns_changed(target, "full_name", "phone"):
+        _reindex_user(connection, target.id)
+
+
+@event.listens_for(Doctor, "after_insert")
+def index_new_doctor(_mapper, connection, target) -> None:
+    _reindex_user(connection, target.user_id)
+
+
+@event.listens_for(Doctor, "after_update")
+def index_doctor(_mapper, connection, target) -> None:
+    if _search_columns_changed(target, "specialization", "user_id"):
+        _reindex_user(connection, target.user_id)
+
+
+@event.listens_for(User, "after_delete")
+def unindex_user(_mapper, connection, target) -> None:
+    connection.execute(
+        text("DELETE FROM user_search WHERE rowid = :user_id"), {"user_id": target.id}
+    )
+
+
+_SEARCH_COLUMNS = {
+    "full_name": User.full_name,
+    "phone": User.phone,
+    "specialization": Doctor.specialization,
+}
+
+
+def user_search_filter(query: str, *columns: str):
+    """Return a filter matching users whose ``columns`` contain ``query``.
+
+    This matches like ``ILIKE '%query%'``. Queries of three or more
+    characters go through the trigram FTS5 index; shorter ones fall back to
+    ``ILIKE``, which the trigram tokenizer cannot serve. ``specialization``
+    requires the caller to join ``doctors``.
+    """
+    unknown = set(columns) - set(_SEARCH_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown search columns: {sorted(unknown)!r}")
+    if len(query) < _TRIGRAM_MIN_LENGTH:
+        return or_(*(_SEARCH_COLUMNS[name].ilike(f"%{query}%") for name in columns))
+    phrase = '"' + query.replace('"', '""') + '"'
+    match = "{" + " ".join(columns) + "} : " + phrase
+    return User.id.in_(
+        select(user_search.c.rowid)
+        .select_from(user_search)
+        .where(text("user_search MATCH :query").bindparams(query=match))
+    )
+
+
+def create_missing_indexes() -> None:
+    """Add indexes declared on the models to tables that already exist.
+
+    ``db.create_all()`` only emits indexes alongside a new table, so
+    databases created before an index was declared would never get it.
+    """
+    for model_table in db.metadata.sorted_tables:
+        for index in model_table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+
+_initialized = False
+
+
+def init_db(app) -> None:
+    """Create tables and seed default records if they don't exist.
+
+    Must be called inside an application context. Repeat calls in the same
+    process are no-ops.
+    """
+    global _initialized
+    if _initialized:
+        return
+
+    db.create_all()
+    create_missing_indexes()
+    create_search_index()
+
+    department_count, admin_id = db.session.execute(
+        select(
+            select(func.count()).select_from(Department).scalar_subquery(),
+            select(User.id)
+            .where(User.role == UserRole.ADMIN)
+            .limit(1)
+            .scalar_subquery(),
+        )
+    ).one()
+
+    if department_count == 0:
+        # Bulk inserts skip mapper events, which is fine here: nothing has
+        # been cached yet and departments are not part of the search index.
+        db.session.bulk_insert_mappings(Department, create_default_departments())
+
+    if admin_id is None:
+        admin_user = User(
+            full_name="Hospital Admin",
+            email="admin@hms.local",
+            phone="0000000000",
+            role=UserRole.ADMIN,
+            password_hash=password_hasher.hash("Admin@123"),
+        )
+        db.session.add(admin_user)
+
+    if department_count == 0 or admin_id is None:
+        db.session.commit()
+    _initialized = True